@@ -12,11 +12,17 @@ NotPortable 올인원 라즈베리파이 서버
 
 import os
 import re
+import json
 import sys
+import zlib
+import ctypes
+import struct
+import tempfile
+import functools
 import time
-import socket
+import signal
+import asyncio
 import threading
-import subprocess
 import requests
 from datetime import datetime
 
@@ -29,6 +35,24 @@ except ImportError:
     print("   설치: sudo apt install python3-evdev")
     EVDEV_AVAILABLE = False
 
+# 로그 파일 변경 감지용 (없으면 10초 간격 폴링)
+try:
+    from inotify_simple import INotify, flags
+    INOTIFY_AVAILABLE = True
+except ImportError:
+    print("⚠️  inotify_simple 없음 - 로그 감시를 10초 폴링으로 대체")
+    print("   설치: pip install inotify_simple")
+    INOTIFY_AVAILABLE = False
+
+# API 전송 JSON 직렬화용 (없으면 표준 json)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    print("⚠️  orjson 없음 - 표준 json으로 직렬화")
+    print("   설치: pip install orjson")
+    ORJSON_AVAILABLE = False
+
 # =================================================================
 # 📌 설정
 # =================================================================
@@ -39,6 +63,9 @@ UDP_PORT = 4200
 # API 설정
 API_BASE_URL = "http://localhost:8000/api"
 
+# HTTP 연결 재사용 (전송마다 새 TCP 연결을 맺지 않도록 keep-alive 세션 공유)
+http_session = requests.Session()
+
 # 로그 파일 경로
 LOG_PATHS = {
     "neverball": os.path.expanduser("~/.neverball/Scores/easy.txt"),
@@ -46,6 +73,9 @@ LOG_PATHS = {
     "etr": os.path.expanduser("~/.config/etr/highscore")
 }
 
+# 로그 감시 상태 저장 파일 (재시작 시 바뀌지 않은 로그는 다시 파싱하지 않음)
+STATE_FILE = os.path.expanduser("~/.notportable/offsets.json")
+
 # SuperTux 사용자 이름 파일
 SUPERTUX_USERNAME_FILE = "/tmp/supertux_username.txt"
 
@@ -53,6 +83,16 @@ SUPERTUX_USERNAME_FILE = "/tmp/supertux_username.txt"
 THRESHOLD_LOW = 1000
 THRESHOLD_HIGH = 3000
 
+# ESP32 바이너리 패킷 (17바이트, little-endian)
+# x, y (int16) / sw, up, left, down, right (uint8) / pitch, roll (float32)
+# 기존 CSV 패킷 "x,y,sw,up,left,down,right,pitch,roll"도 계속 받음
+CONTROLLER_PACKET = struct.Struct("<hhBBBBBff")
+
+# uinput에 직접 쓰는 struct input_event (timeval sec/usec, type, code, value)
+# 시간은 커널이 채우므로 0 - 바뀐 키들과 SYN_REPORT를 write 한 번으로 전송
+INPUT_EVENT = struct.Struct("llHHi")
+SYN_REPORT_EVENT = INPUT_EVENT.pack(0, 0, 0, 0, 0)  # EV_SYN=0, SYN_REPORT=0
+
 # =================================================================
 # 📐 MPU 기반 이상 감지 (초음파 대신)
 # =================================================================
@@ -60,6 +100,13 @@ THRESHOLD_HIGH = 3000
 class MPUAnomalyDetector:
     """ESP32에서 받은 MPU 데이터로 이상 감지"""
     
+    # 패킷마다 update()가 불리므로 속성 접근을 __dict__ 대신 슬롯으로
+    __slots__ = (
+        'enabled', 'baseline_pitch', 'baseline_roll', 'current_pitch', 'current_roll',
+        'last_check_time', 'check_interval', 'pitch_threshold', 'roll_threshold',
+        'sample_count', 'sum_pitch', 'sum_roll', 'calibration_count'
+    )
+    
     def __init__(self):
         self.enabled = True
         self.baseline_pitch = None
@@ -73,8 +120,10 @@ class MPUAnomalyDetector:
         self.pitch_threshold = 35.0  # 35도 이상 변화시 이상
         self.roll_threshold = 35.0
         
-        # 캘리브레이션용 샘플
-        self.calibration_samples = []
+        # 캘리브레이션용 누적 합 (샘플 목록 대신 합계만 유지)
+        self.sample_count = 0
+        self.sum_pitch = 0.0
+        self.sum_roll = 0.0
         self.calibration_count = 10  # 처음 10개 샘플로 기준값 설정
         
         print("📐 MPU 이상 감지 모듈 초기화")
@@ -87,11 +136,13 @@ class MPUAnomalyDetector:
         
         # 캘리브레이션 중
         if self.baseline_pitch is None:
-            self.calibration_samples.append((pitch, roll))
-            if len(self.calibration_samples) >= self.calibration_count:
+            self.sample_count += 1
+            self.sum_pitch += pitch
+            self.sum_roll += roll
+            if self.sample_count >= self.calibration_count:
                 # 평균으로 기준값 설정
-                avg_pitch = sum(s[0] for s in self.calibration_samples) / len(self.calibration_samples)
-                avg_roll = sum(s[1] for s in self.calibration_samples) / len(self.calibration_samples)
+                avg_pitch = self.sum_pitch / self.sample_count
+                avg_roll = self.sum_roll / self.sample_count
                 self.baseline_pitch = avg_pitch
                 self.baseline_roll = avg_roll
                 print(f"   ✅ 기준값 설정 완료: Pitch={avg_pitch:.1f}°, Roll={avg_roll:.1f}°")
@@ -128,13 +179,29 @@ mpu_detector = MPUAnomalyDetector()
 # 🎮 가상 키보드 컨트롤러
 # =================================================================
 
+class ControllerProtocol(asyncio.DatagramProtocol):
+    """이벤트 루프에서 UDP 패킷을 받아 가상 키보드로 전달"""
+    
+    def __init__(self, keyboard):
+        self.keyboard = keyboard
+    
+    def datagram_received(self, data, addr):
+        try:
+            self.keyboard._process_data(data)
+        except Exception as err:
+            print(f"⚠️  수신 오류: {err}")
+    
+    def error_received(self, exc):
+        print(f"⚠️  수신 오류: {exc}")
+
 class VirtualKeyboard:
     """UDP로 받은 데이터를 가상 키보드 입력으로 변환"""
     
     def __init__(self):
         self.keyboard = None
-        self.sock = None
+        self.transport = None
         self.running = False
+        self.key_state = {}  # 마지막으로 보낸 키 상태 (바뀐 키만 전송)
         
         if not EVDEV_AVAILABLE:
             print("⚠️  가상 키보드 비활성화됨")
@@ -155,55 +222,47 @@ class VirtualKeyboard:
             print(f"❌ 가상 키보드 생성 실패: {err}")
             print("   sudo로 실행해야 합니다!")
     
-    def start(self):
-        """UDP 수신 시작"""
+    async def start(self):
+        """UDP 수신 시작 (별도 스레드 없이 이벤트 루프에 등록)"""
         if not EVDEV_AVAILABLE or not self.keyboard:
             return
         
+        loop = asyncio.get_running_loop()
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.sock.bind(('0.0.0.0', UDP_PORT))
-            self.sock.settimeout(1.0)  # 1초 타임아웃
+            self.transport, _ = await loop.create_datagram_endpoint(
+                lambda: ControllerProtocol(self),
+                local_addr=('0.0.0.0', UDP_PORT)
+            )
             print(f"✅ UDP 포트 {UDP_PORT} 수신 대기")
             self.running = True
         except OSError as err:
             print(f"❌ UDP 포트 에러: {err}")
             return
         
-        # 별도 스레드에서 실행
-        thread = threading.Thread(target=self._receive_loop, daemon=True)
-        thread.start()
         print("🎮 컨트롤러 입력 수신 중...")
     
-    def _receive_loop(self):
-        """UDP 데이터 수신 루프"""
-        while self.running:
-            try:
-                data, addr = self.sock.recvfrom(1024)
-                self._process_data(data)
-            except socket.timeout:
-                continue
-            except Exception as err:
-                if self.running:
-                    print(f"⚠️  수신 오류: {err}")
-    
     def _process_data(self, data):
         """수신된 데이터 처리"""
         try:
-            parts = data.decode('utf-8').split(',')
-            if len(parts) != 9:
-                return
-            
-            # 데이터 파싱
-            x_val = int(parts[0])
-            y_val = int(parts[1])
-            sw_pressed = (parts[2] == '1')
-            btn_up = (parts[3] == '1')
-            btn_left = (parts[4] == '1')
-            btn_down = (parts[5] == '1')
-            btn_right = (parts[6] == '1')
-            pitch = float(parts[7])
-            roll = float(parts[8])
+            # 바이너리 패킷: unpack 한 번으로 파싱 (쉼표 8개면 17자짜리 CSV)
+            if len(data) == CONTROLLER_PACKET.size and data.count(b',') != 8:
+                (x_val, y_val, sw_pressed, btn_up, btn_left, btn_down, btn_right,
+                 pitch, roll) = CONTROLLER_PACKET.unpack(data)
+            else:
+                parts = data.decode('utf-8').split(',')
+                if len(parts) != 9:
+                    return
+                
+                # 데이터 파싱
+                x_val = int(parts[0])
+                y_val = int(parts[1])
+                sw_pressed = (parts[2] == '1')
+                btn_up = (parts[3] == '1')
+                btn_left = (parts[4] == '1')
+                btn_down = (parts[5] == '1')
+                btn_right = (parts[6] == '1')
+                pitch = float(parts[7])
+                roll = float(parts[8])
             
             # MPU 데이터 업데이트 (이상 감지용)
             mpu_detector.update(pitch, roll)
@@ -216,17 +275,28 @@ class VirtualKeyboard:
             button_up = btn_up  # 버튼 위
             key_enter = sw_pressed
             
-            # 키 전송
-            self.keyboard.write(e.EV_KEY, e.KEY_RIGHT, 1 if key_right else 0)
-            self.keyboard.write(e.EV_KEY, e.KEY_LEFT, 1 if key_left else 0)
-            self.keyboard.write(e.EV_KEY, e.KEY_DOWN, 1 if key_down else 0)
-            self.keyboard.write(e.EV_KEY, e.KEY_ENTER, 1 if key_enter else 0)
+            # 키 상태 (조이스틱 위 = 방향키만, 버튼 위 = 방향키 + 스페이스바)
+            keys = (
+                (e.KEY_RIGHT, key_right),
+                (e.KEY_LEFT, key_left),
+                (e.KEY_DOWN, key_down),
+                (e.KEY_ENTER, key_enter),
+                (e.KEY_UP, joystick_up or button_up),
+                (e.KEY_SPACE, button_up)
+            )
             
-            # 조이스틱 위 = 방향키만, 버튼 위 = 방향키 + 스페이스바
-            self.keyboard.write(e.EV_KEY, e.KEY_UP, 1 if (joystick_up or button_up) else 0)
-            self.keyboard.write(e.EV_KEY, e.KEY_SPACE, 1 if button_up else 0)
+            # 이전 패킷과 달라진 키만 모아서 SYN과 함께 한 번에 전송
+            # 바뀐 게 없으면 write 자체를 생략
+            events = []
+            for key, pressed in keys:
+                value = 1 if pressed else 0
+                if self.key_state.get(key) != value:
+                    events.append(INPUT_EVENT.pack(0, 0, e.EV_KEY, key, value))
+                    self.key_state[key] = value
             
-            self.keyboard.syn()
+            if events:
+                events.append(SYN_REPORT_EVENT)
+                os.write(self.keyboard.fd, b''.join(events))
             
         except ValueError:
             pass
@@ -236,53 +306,64 @@ class VirtualKeyboard:
         self.running = False
         if self.keyboard:
             self.keyboard.close()
-        if self.sock:
-            self.sock.close()
+        if self.transport:
+            self.transport.close()
 
 # =================================================================
 # 📖 로그 파서
 # =================================================================
 
-def parse_neverball_log(filepath):
-    """Neverball 로그 파싱"""
-    if not os.path.exists(filepath):
-        return []
-    
+# 정규식은 모듈 로드 시 한 번만 컴파일
+# Neverball/ETR은 파일 전체(bytes)에 bytes 정규식을 한 번에 돌림 - 한 줄 = 한 매치
+NEVERBALL_LINE_RE = re.compile(rb'^[ \t]*(\d+)[ \t]+(\d+)[ \t]+(\S+)[ \t\r]*$', re.MULTILINE)
+SUPERTUX_LEVEL_RE = re.compile(
+    r'\("([^"]+\.stl)"\s+\(perfect\s+[^)]+\)\s+\("statistics"[^)]+\(coins-collected\s+(\d+)\)[^)]+\(secrets-found\s+(\d+)\)[^)]+\(time-needed\s+([\d.]+)\)',
+    re.DOTALL
+)
+# ETR highscore 한 줄: *[course] .. [plyr] .. [pts] .. [herr] .. [time] .. (이 순서로 저장됨)
+ETR_LINE_RE = re.compile(
+    rb'\[course\][ \t]+(?P<course>\S+).*?\[plyr\][ \t]+(?P<plyr>\S+).*?\[pts\][ \t]+(?P<pts>\d+)'
+    rb'.*?\[herr\][ \t]+(?P<herr>\d+).*?\[time\][ \t]+(?P<time>[\d.]+)'
+)
+
+# Neverball 점수 파일의 난이도 헤더 줄 (기록 아님)
+NEVERBALL_DIFFICULTY_NAMES = frozenset(('Hard', 'Medium', 'Easy'))
+
+@functools.lru_cache(maxsize=2048)
+def neverball_fields(time_ms, coins, username):
+    """정규식 그룹(bytes) → (username, score, coins, 시간 문자열)
+    점수 파일은 다시 쓰일 때마다 같은 줄이 반복되므로 변환 결과를 캐시"""
+    time_sec = int(time_ms) / 100.0
+    minutes = int(time_sec // 60)
+    seconds = int(time_sec % 60)
+    time_str = f"{minutes:02d}:{seconds:02d}"
+    return username.decode('utf-8', errors='ignore'), int(time_ms), int(coins), time_str
+
+def parse_neverball_log_bytes(buf):
+    """Neverball 점수 데이터(파일 전체 또는 새로 추가된 부분) 파싱"""
+    # 같은 기록 중복은 DB UNIQUE(username, score, coins, time)에서 걸러짐
     logs = []
-    seen_records = set()
+    # 반복문 안에서 쓰는 메서드는 지역 변수로 묶어 속성 조회 생략
+    append = logs.append
+    fields = neverball_fields
+    check_anomaly = mpu_detector.check_anomaly
     
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            line = line.strip()
-            match = re.match(r'^(\d+)\s+(\d+)\s+(\S+)$', line)
-            if match:
-                time_ms, coins, username = match.groups()
+        for match in NEVERBALL_LINE_RE.finditer(buf):
+            username, score, coins, time_str = fields(*match.groups())
+            
+            if username not in NEVERBALL_DIFFICULTY_NAMES:
+                # MPU로 이상 감지
+                is_anomaly = check_anomaly()
                 
-                if username not in ['Hard', 'Medium', 'Easy']:
-                    time_sec = int(time_ms) / 100.0
-                    minutes = int(time_sec // 60)
-                    seconds = int(time_sec % 60)
-                    time_str = f"{minutes:02d}:{seconds:02d}"
-                    
-                    record_key = (username, int(time_ms), int(coins))
-                    if record_key in seen_records:
-                        continue
-                    seen_records.add(record_key)
-                    
-                    # MPU로 이상 감지
-                    is_anomaly = mpu_detector.check_anomaly()
-                    
-                    logs.append({
-                        "username": username,
-                        "level": 1,
-                        "score": int(time_ms),
-                        "coins": int(coins),
-                        "time": time_str,
-                        "is_anomaly": is_anomaly
-                    })
+                append({
+                    "username": username,
+                    "level": 1,
+                    "score": score,
+                    "coins": coins,
+                    "time": time_str,
+                    "is_anomaly": is_anomaly
+                })
         
         if logs:
             print(f"📖 Neverball: {len(logs)}개 기록 발견")
@@ -304,8 +385,7 @@ def parse_supertux_log(filepath):
         with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
             content = f.read()
         
-        level_pattern = r'\("([^"]+\.stl)"\s+\(perfect\s+[^)]+\)\s+\("statistics"[^)]+\(coins-collected\s+(\d+)\)[^)]+\(secrets-found\s+(\d+)\)[^)]+\(time-needed\s+([\d.]+)\)'
-        matches = re.finditer(level_pattern, content, re.DOTALL)
+        matches = SUPERTUX_LEVEL_RE.finditer(content)
         
         # 사용자 이름 가져오기
         username = "Player"
@@ -351,45 +431,42 @@ def parse_supertux_log(filepath):
         print(f"❌ SuperTux 파싱 오류: {e}")
         return []
 
-def parse_etr_log(filepath):
-    """ETR 로그 파싱"""
-    if not os.path.exists(filepath):
-        return []
-    
+@functools.lru_cache(maxsize=2048)
+def etr_fields(course, plyr, pts, herr, secs):
+    """정규식 그룹(bytes) → (course, username, score, herring, 시간 문자열), 결과 캐시"""
+    time_sec = float(secs)
+    minutes = int(time_sec // 60)
+    seconds = time_sec % 60
+    time_str = f"{minutes:02d}:{seconds:05.2f}"
+    return (
+        course.decode('utf-8', errors='ignore').replace('_', ' '),
+        plyr.decode('utf-8', errors='ignore'),
+        int(pts),
+        int(herr),
+        time_str
+    )
+
+def parse_etr_log_bytes(buf):
+    """ETR highscore 데이터(파일 전체 또는 새로 추가된 부분) 파싱"""
     logs = []
+    append = logs.append
+    fields = etr_fields
+    check_anomaly = mpu_detector.check_anomaly
     
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            course_match = re.search(r'\[course\]\s+(\S+)', line)
-            plyr_match = re.search(r'\[plyr\]\s+(\S+)', line)
-            pts_match = re.search(r'\[pts\]\s+(\d+)', line)
-            herr_match = re.search(r'\[herr\]\s+(\d+)', line)
-            time_match = re.search(r'\[time\]\s+([\d.]+)', line)
+        for match in ETR_LINE_RE.finditer(buf):
+            course, username, score, herring, time_str = fields(*match.groups())
             
-            if all([course_match, plyr_match, pts_match, herr_match, time_match]):
-                course = course_match.group(1).replace('_', ' ')
-                username = plyr_match.group(1)
-                score = int(pts_match.group(1))
-                herring = int(herr_match.group(1))
-                time_sec = float(time_match.group(1))
-                
-                minutes = int(time_sec // 60)
-                seconds = time_sec % 60
-                time_str = f"{minutes:02d}:{seconds:05.2f}"
-                
-                is_anomaly = mpu_detector.check_anomaly()
-                
-                logs.append({
-                    "username": username,
-                    "course": course,
-                    "score": score,
-                    "herring": herring,
-                    "time": time_str,
-                    "is_anomaly": is_anomaly
-                })
+            is_anomaly = check_anomaly()
+            
+            append({
+                "username": username,
+                "course": course,
+                "score": score,
+                "herring": herring,
+                "time": time_str,
+                "is_anomaly": is_anomaly
+            })
         
         if logs:
             print(f"📖 ETR: {len(logs)}개 기록 발견")
@@ -399,25 +476,62 @@ def parse_etr_log(filepath):
         print(f"❌ ETR 파싱 오류: {e}")
         return []
 
+# 게임별 파서: (파서 함수, 새로 추가된 부분(bytes)만 넘기는지)
+# SuperTux는 S-expression 파일이라 매번 통째로 다시 쓰임 - 경로를 넘겨 전체 파싱
+PARSERS = {
+    "neverball": (parse_neverball_log_bytes, True),
+    "supertux": (parse_supertux_log, False),
+    "etr": (parse_etr_log_bytes, True),
+}
+
+# 이미 보낸 기록 판별 키 (서버 DB의 UNIQUE 제약과 같은 컬럼)
+DEDUP_KEYS = {
+    "neverball": ("username", "score", "coins", "time"),
+    "supertux": ("level", "time"),
+    "etr": ("username", "course", "score", "herring", "time"),
+}
+
+def dumps_json(obj):
+    """JSON 직렬화 → bytes (orjson 있으면 사용)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+def loads_json(data):
+    """JSON 역직렬화 (orjson 있으면 사용)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
 def send_to_api(game, logs):
-    """API로 로그 전송"""
-    success_count = 0
-    anomaly_count = 0
-    duplicate_count = 0
+    """API로 로그 전송 (일괄 엔드포인트로 한 번에). 서버가 받았으면(200) True"""
+    try:
+        response = http_session.post(
+            f"{API_BASE_URL}/{game}/logs",
+            data=dumps_json(logs),
+            headers={"Content-Type": "application/json"},
+            timeout=5
+        )
+    except requests.exceptions.ConnectionError:
+        return False  # API 서버 없으면 조용히 무시
+    except Exception as e:
+        print(f"❌ [{game}] 전송 실패: {e}")
+        return False
     
-    for log in logs:
-        try:
-            response = requests.post(f"{API_BASE_URL}/{game}/log", json=log, timeout=5)
-            if response.status_code == 200:
-                success_count += 1
-                if log.get('is_anomaly'):
-                    anomaly_count += 1
-            elif response.status_code == 409:
-                duplicate_count += 1
-        except requests.exceptions.ConnectionError:
-            pass  # API 서버 없으면 조용히 무시
-        except Exception as e:
-            print(f"❌ [{game}] 전송 실패: {e}")
+    if response.status_code != 200:
+        print(f"❌ [{game}] 전송 실패: HTTP {response.status_code}")
+        return False
+    
+    # 저장은 끝났으므로 응답 본문이 이상해도 성공으로 처리 (개수 표시만 생략)
+    try:
+        result = loads_json(response.content)
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        result = {}
+    success_count = result.get("inserted", 0)
+    duplicate_count = result.get("duplicates", 0)
+    anomaly_count = sum(1 for log in logs if log.get('is_anomaly'))
     
     if success_count > 0 or duplicate_count > 0:
         status = f"✅ [{game}]"
@@ -428,32 +542,56 @@ def send_to_api(game, logs):
         if anomaly_count > 0:
             status += f" (🚨 이상 {anomaly_count}개)"
         print(status)
+    return True
 
 # =================================================================
 # 🎮 게임 런처
 # =================================================================
 
+# 메뉴 번호 -> (실행 파일, 이름, 이모지)
+GAMES = {
+    1: ("/usr/games/neverball", "Neverball", "🏀"),
+    2: ("/usr/games/supertux2", "SuperTux", "🐧"),
+    3: ("/usr/games/etr", "ETR", "🎿")
+}
+
+# 설치 여부는 시작 시 한 번만 확인 (메뉴 표시 + 실행 전 확인에 사용)
+AVAILABLE = {choice: os.access(path, os.X_OK) for choice, (path, _, _) in GAMES.items()}
+
 def save_username(username):
-    """SuperTux용 사용자 이름 저장"""
+    """SuperTux용 사용자 이름 저장
+    임시 파일에 다 쓴 뒤 os.replace로 교체 - 읽는 쪽이 빈 파일을 보는 일이 없음
+    임시 파일은 mkstemp로 새로 만듦 (/tmp에 미리 심어둔 심볼릭 링크를 따라가지 않도록)"""
+    tmp_path = None
     try:
-        with open(SUPERTUX_USERNAME_FILE, 'w') as f:
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".supertux_username.", dir=os.path.dirname(SUPERTUX_USERNAME_FILE)
+        )
+        with os.fdopen(fd, 'w') as f:
+            os.fchmod(f.fileno(), 0o644)  # mkstemp는 0600 - 기존 파일처럼 읽기 허용
             f.write(username)
-    except:
-        pass
-
-def launch_game(choice, username):
-    """게임 실행"""
-    games = {
-        1: ("/usr/games/neverball", "Neverball", "🏀"),
-        2: ("/usr/games/supertux2", "SuperTux", "🐧"),
-        3: ("/usr/games/etr", "ETR", "🎿")
-    }
-    
-    if choice not in games:
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SUPERTUX_USERNAME_FILE)
+    except OSError as e:
+        print(f"⚠️  사용자 이름 저장 실패: {e}")
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+async def launch_game(choice, username):
+    """게임 실행 (종료까지 기다리는 동안에도 이벤트 루프는 계속 동작)"""
+    if choice not in GAMES:
         print("❌ 잘못된 선택")
         return
     
-    path, name, emoji = games[choice]
+    path, name, emoji = GAMES[choice]
+    
+    if not AVAILABLE[choice]:
+        print(f"❌ {name} 설치되지 않음: {path}")
+        return
     
     # SuperTux만 사용자 이름 저장
     if choice == 2 and username:
@@ -464,32 +602,162 @@ def launch_game(choice, username):
     
     try:
         # 게임 실행 (종료까지 대기)
-        subprocess.run([path], check=False)
+        proc = await asyncio.create_subprocess_exec(path)
+        try:
+            await proc.wait()
+        except asyncio.CancelledError:
+            # 실행 중 종료 요청 - 게임도 함께 종료
+            proc.terminate()
+            raise
         print(f"\n✅ {name} 종료")
     except FileNotFoundError:
         print(f"❌ {name} 설치되지 않음: {path}")
     except Exception as e:
         print(f"❌ 실행 오류: {e}")
 
+def game_menu_line(choice, line):
+    """설치 안 된 게임은 이름 뒤 공백 자리에 (미설치) 표시 (같은 폭이라 테두리 유지)"""
+    if AVAILABLE[choice]:
+        return line
+    return line.replace(" " * 9, " (미설치)", 1)
+
+# 메인 메뉴 (바뀌지 않으므로 미리 UTF-8로 인코딩해 두고 한 번의 write로 출력)
+MENU = "\n".join([
+    "\n",
+    "╔════════════════════════════════════════╗",
+    "║       🎮 NotPortable 올인원 🎮          ║",
+    "╠════════════════════════════════════════╣",
+    game_menu_line(1, "║  [1] 🏀 Neverball                      ║"),
+    game_menu_line(2, "║  [2] 🐧 SuperTux                       ║"),
+    game_menu_line(3, "║  [3] 🎿 Extreme Tux Racer              ║"),
+    "║  ────────────────────────────────────  ║",
+    "║  [4] 📊 로그 수동 파싱                  ║",
+    "║  [5] 📐 MPU 상태 확인                  ║",
+    "║  [0] 🚪 종료                           ║",
+    "╚════════════════════════════════════════╝",
+]).encode('utf-8') + b"\n"
+
 def show_menu():
-    """메인 메뉴 출력"""
-    print("\n")
-    print("╔════════════════════════════════════════╗")
-    print("║       🎮 NotPortable 올인원 🎮          ║")
-    print("╠════════════════════════════════════════╣")
-    print("║  [1] 🏀 Neverball                      ║")
-    print("║  [2] 🐧 SuperTux                       ║")
-    print("║  [3] 🎿 Extreme Tux Racer              ║")
-    print("║  ────────────────────────────────────  ║")
-    print("║  [4] 📊 로그 수동 파싱                  ║")
-    print("║  [5] 📐 MPU 상태 확인                  ║")
-    print("║  [0] 🚪 종료                           ║")
-    print("╚════════════════════════════════════════╝")
+    """메인 메뉴 출력 (텍스트 계층을 거치지 않고 바로 stdout 버퍼에)"""
+    sys.stdout.flush()  # 앞서 print한 내용이 메뉴보다 먼저 나가도록
+    sys.stdout.buffer.write(MENU)
+    sys.stdout.buffer.flush()
+
+async def wait_readable(fd):
+    """fd가 읽기 가능해질 때까지 대기 (이벤트 루프의 epoll에 등록)"""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(fd)
+
+# stdin에서 읽었지만 아직 돌려주지 않은 바이트 (파이프로 여러 줄이 한 번에 와도 잃지 않음)
+# sys.stdin.readline()은 TextIOWrapper 내부 버퍼에 다음 줄까지 읽어 두어,
+# 그 뒤 fd를 기다리면 이미 읽힌 줄을 두고 멈추므로 fd를 직접 읽는다
+stdin_buffer = bytearray()
+
+async def ainput(prompt=""):
+    """이벤트 루프를 막지 않는 input() - stdin이 읽기 가능해질 때까지 대기"""
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    while b'\n' not in stdin_buffer:
+        try:
+            await wait_readable(fd)
+            chunk = os.read(fd, 4096)
+        except PermissionError:
+            # 일반 파일, /dev/null은 epoll에 등록 불가 (sudo python3 parser.py < cmds.txt)
+            chunk = await loop.run_in_executor(None, os.read, fd, 4096)
+        if not chunk:
+            break
+        stdin_buffer.extend(chunk)
+    
+    if not stdin_buffer:
+        raise EOFError
+    end = stdin_buffer.find(b'\n') + 1 or len(stdin_buffer)
+    line = bytes(stdin_buffer[:end])
+    del stdin_buffer[:end]
+    return line.decode('utf-8', errors='replace').rstrip("\n")
 
 # =================================================================
 # 📊 로그 감시 스레드
 # =================================================================
 
+# fanotify (root 전용) - linux/fanotify.h
+FAN_CLOEXEC = 0x00000001
+FAN_NONBLOCK = 0x00000002
+FAN_CLASS_NOTIF = 0x00000000
+FAN_MARK_ADD = 0x00000001
+FAN_MODIFY = 0x00000002
+FAN_CLOSE_WRITE = 0x00000008
+FAN_Q_OVERFLOW = 0x00004000
+FAN_EVENT_ON_CHILD = 0x08000000
+AT_FDCWD = -100
+# struct fanotify_event_metadata: event_len, vers, reserved, metadata_len, mask, fd, pid
+FAN_EVENT_METADATA = struct.Struct("=IBBHQii")
+
+class Fanotify:
+    """fanotify 래퍼 (ctypes)
+    디렉터리마다 마크 하나로 그 안의 파일 변경을 모두 받음 - 파일이 교체되어도
+    다시 등록할 필요 없음. 이벤트마다 파일 fd가 오므로 /proc/self/fd로 경로 확인."""
+    
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.fanotify_init.argtypes = [ctypes.c_uint, ctypes.c_uint]
+        self.libc.fanotify_mark.argtypes = [
+            ctypes.c_int, ctypes.c_uint, ctypes.c_uint64, ctypes.c_int, ctypes.c_char_p
+        ]
+        
+        self.fd = self.libc.fanotify_init(
+            FAN_CLOEXEC | FAN_NONBLOCK | FAN_CLASS_NOTIF,
+            os.O_RDONLY | os.O_CLOEXEC | getattr(os, 'O_LARGEFILE', 0)
+        )
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    
+    def mark(self, directory):
+        """디렉터리 안 파일들의 수정/쓰기 종료 이벤트 구독"""
+        mask = FAN_MODIFY | FAN_CLOSE_WRITE | FAN_EVENT_ON_CHILD
+        if self.libc.fanotify_mark(self.fd, FAN_MARK_ADD, mask, AT_FDCWD, os.fsencode(directory)) < 0:
+            return False
+        return True
+    
+    def fileno(self):
+        return self.fd
+    
+    def read(self):
+        """지금 쌓여 있는 이벤트의 파일 경로 목록 (기다리지 않음)
+        큐가 넘쳐 이벤트를 잃었으면 None 포함"""
+        try:
+            data = os.read(self.fd, FAN_EVENT_METADATA.size * 256)
+        except BlockingIOError:
+            return []
+        
+        paths = []
+        pos = 0
+        while pos + FAN_EVENT_METADATA.size <= len(data):
+            event_len, _, _, _, mask, fd, _ = FAN_EVENT_METADATA.unpack_from(data, pos)
+            pos += event_len
+            if mask & FAN_Q_OVERFLOW:
+                paths.append(None)
+            if fd < 0:
+                continue
+            try:
+                paths.append(os.readlink(f"/proc/self/fd/{fd}"))
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+        return paths
+    
+    def close(self):
+        os.close(self.fd)
+
 class LogWatcher:
     """로그 파일 변경 감시"""
     
@@ -497,70 +765,403 @@ class LogWatcher:
         self.running = False
         self.last_modified = {}
         
-        # 초기 수정 시간 저장
+        # 초기 수정 시간 저장 (정수 ns - stat 한 번으로 존재 여부까지 확인)
         for game, path in LOG_PATHS.items():
-            if os.path.exists(path):
-                self.last_modified[game] = os.path.getmtime(path)
-            else:
+            try:
+                self.last_modified[game] = os.stat(path).st_mtime_ns
+            except OSError:
                 self.last_modified[game] = 0
+        
+        # 파일별로 어디까지 읽었는지: game -> (offset, 읽은 부분의 crc32)
+        # 시작 시 parse_all이 저장된 위치(없으면 0)부터 읽고, 이후에는 새로 추가된 줄만 파싱
+        self.offsets = {game: (0, 0) for game in LOG_PATHS}
+        self.offsets_lock = threading.Lock()
+        
+        # 개행 없는 마지막 줄을 다음으로 미뤘는지 - 파일이 잠잠해지면 마저 파싱
+        self.deferred_tail = {game: False for game in LOG_PATHS}
+        self.settlers = set()
+        
+        # 이번 실행에서 서버가 이미 받은 기록 (게임별 DEDUP_KEYS 값 튜플)
+        # 파일이 제자리에서 다시 쓰여 처음부터 파싱해도 같은 기록은 다시 보내지 않음
+        self.seen = {game: set() for game in LOG_PATHS}
+        
+        # 마지막으로 파싱한 시점의 파일 상태: game -> (mtime_ns, size)
+        self.parsed_stat = {}
+        
+        # 전송 결과 추적: 대기 중인 배치 수, 전송에 실패한 게임
+        # 둘 중 하나라도 걸린 게임은 상태를 저장하지 않음 → 다음 실행에서 처음부터 다시 전송
+        self.pending = {game: 0 for game in LOG_PATHS}
+        self.failed = set()
+        self._load_state()
+        
+        # inotify: 파일이 실제로 바뀔 때만 커널이 알려줌
+        self.task = None
+        
+        # 파싱 결과 전송 대기열: (game, logs, 파일 전체인지) - 전송 워커가 모아서 보냄
+        self.send_queue = asyncio.Queue()
+        self.sender = None
+        
+        # root면 fanotify: 로그 디렉터리에 마크 (파일이 교체돼도 재등록 불필요)
+        self.fanotify = None
+        self.fan_paths = {os.path.realpath(path): game for game, path in LOG_PATHS.items()}
+        self.unmarked = {os.path.dirname(path) for path in self.fan_paths}  # 아직 없는 디렉터리
+        if os.geteuid() == 0 and sys.platform.startswith('linux'):
+            try:
+                self.fanotify = Fanotify()
+                self._mark_dirs()
+            except (OSError, AttributeError) as e:
+                print(f"⚠️  fanotify 사용 불가 ({e}) - inotify로 대체")
+                self.fanotify = None
+        
+        self.inotify = None
+        self.watches = {}      # wd -> game
+        self.unwatched = set()  # 아직 없거나 교체되어 감시가 풀린 파일
+        if INOTIFY_AVAILABLE and not self.fanotify:
+            self.inotify = INotify()
+            for game in LOG_PATHS:
+                if not self._add_watch(game):
+                    self.unwatched.add(game)
+    
+    def _mark_dirs(self):
+        """아직 마크하지 못한 로그 디렉터리 등록 (새로 마크된 게임 목록 반환)"""
+        marked = []
+        for directory in list(self.unmarked):
+            if self.fanotify.mark(directory):
+                self.unmarked.discard(directory)
+                marked += [game for path, game in self.fan_paths.items()
+                           if os.path.dirname(path) == directory]
+        return marked
+    
+    def _add_watch(self, game):
+        """로그 파일 자체를 감시 (디렉터리를 감시하면 옆 파일 이벤트까지 들어옴)"""
+        try:
+            wd = self.inotify.add_watch(LOG_PATHS[game], flags.MODIFY | flags.CLOSE_WRITE)
+        except OSError:
+            return False
+        self.watches[wd] = game
+        return True
     
     def start(self):
-        """감시 시작"""
+        """감시 시작 (이벤트 루프의 태스크로 실행)"""
         self.running = True
-        thread = threading.Thread(target=self._watch_loop, daemon=True)
-        thread.start()
-        print("📊 로그 파일 감시 시작 (10초 간격)")
+        self.task = asyncio.create_task(self._watch())
+        self.sender = asyncio.create_task(self._send_worker())
+        if self.fanotify:
+            print("📊 로그 파일 감시 시작 (fanotify)")
+        elif self.inotify:
+            print("📊 로그 파일 감시 시작 (inotify)")
+        else:
+            print("📊 로그 파일 감시 시작 (10초 간격)")
     
-    def _watch_loop(self):
+    async def _watch(self):
         """감시 루프"""
+        if self.fanotify:
+            await self._fanotify_loop()
+        elif self.inotify:
+            await self._inotify_loop()
+        else:
+            await self._poll_loop()
+    
+    async def _wait_events(self, fd, retry):
+        """감시 fd가 읽기 가능해질 때까지 이벤트 루프에서 대기 (스레드 없음)
+        retry: 아직 감시 못 한 파일이 있으면 1초마다 깨어나 다시 등록 시도
+        반환값이 False면 시간 초과 (읽을 이벤트 없음)"""
+        try:
+            await asyncio.wait_for(wait_readable(fd), 1.0 if retry else None)
+        except asyncio.TimeoutError:
+            return False
+        # 저장 중 연달아 오는 MODIFY 이벤트를 한 번에 모아서 처리
+        await asyncio.sleep(0.1)
+        return True
+    
+    async def _inotify_loop(self):
+        """inotify 이벤트가 올 때만 깨어나 처리"""
+        while self.running:
+            changed = set()
+            events = []
+            if await self._wait_events(self.inotify.fileno(), bool(self.unwatched)):
+                events = self.inotify.read(timeout=0)
+            for event in events:
+                game = self.watches.get(event.wd)
+                if game is None:
+                    continue
+                if event.mask & flags.IGNORED:
+                    # 파일이 삭제/교체됨 - 새 파일에 다시 감시 등록
+                    del self.watches[event.wd]
+                    self.unwatched.add(game)
+                else:
+                    changed.add(game)
+            
+            # 감시가 없는 파일은 생겼는지 확인 후 등록
+            for game in list(self.unwatched):
+                if self._add_watch(game):
+                    self.unwatched.discard(game)
+                    changed.add(game)
+            
+            for game in changed:
+                await self._handle_change(game)
+    
+    async def _fanotify_loop(self):
+        """fanotify 이벤트 중 로그 파일 경로인 것만 처리"""
+        while self.running:
+            changed = set()
+            paths = []
+            if await self._wait_events(self.fanotify.fileno(), bool(self.unmarked)):
+                paths = self.fanotify.read()
+            for path in paths:
+                if path is None:
+                    # 이벤트 유실 - 전부 다시 확인
+                    changed.update(LOG_PATHS)
+                elif path in self.fan_paths:
+                    changed.add(self.fan_paths[path])
+            
+            # 디렉터리가 나중에 생긴 경우 마크 후 한 번 확인
+            if self.unmarked:
+                changed.update(self._mark_dirs())
+            
+            for game in changed:
+                await self._handle_change(game)
+    
+    async def _poll_loop(self):
+        """inotify를 못 쓸 때: 10초마다 수정 시간 비교"""
         while self.running:
             for game, path in LOG_PATHS.items():
-                if os.path.exists(path):
-                    current_mtime = os.path.getmtime(path)
-                    if current_mtime > self.last_modified[game]:
-                        print(f"\n🔄 {game} 로그 변경 감지!")
-                        self.last_modified[game] = current_mtime
-                        
-                        if game == "neverball":
-                            logs = parse_neverball_log(path)
-                        elif game == "supertux":
-                            logs = parse_supertux_log(path)
-                        elif game == "etr":
-                            logs = parse_etr_log(path)
-                        else:
-                            logs = []
-                        
-                        if logs:
-                            send_to_api(game, logs)
+                try:
+                    current_mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                if current_mtime > self.last_modified[game]:
+                    self.last_modified[game] = current_mtime
+                    await self._handle_change(game)
             
-            time.sleep(10)
+            await asyncio.sleep(10)
+    
+    async def _handle_change(self, game):
+        """변경된 로그 파싱 후 전송 대기열에 추가"""
+        sys.stdout.write(f"\n🔄 {game} 로그 변경 감지!\n")
+        await self._parse_one(game, wait_for_tail=True)
+    
+    async def _parse_one(self, game, skip_unchanged=False, full=False, wait_for_tail=False):
+        """게임 하나 파싱(스레드 풀) 후 바로 전송 대기열에 추가
+        full: 읽은 위치를 무시하고 파일 전체를 다시 읽어, 이미 보낸 기록까지 전부 전송
+        wait_for_tail: 쓰는 중일 수 있는 개행 없는 마지막 줄은 파일이 잠잠해진 뒤 파싱 (감시 이벤트)"""
+        # 파싱 전에 stat - 파싱 중에 바뀌면 다음 비교에서 달라져 다시 읽게 됨
+        try:
+            st = os.stat(LOG_PATHS[game])
+            stat_key = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat_key = None
+        
+        if skip_unchanged and stat_key is not None and stat_key == self.parsed_stat.get(game):
+            return
+        
+        # 읽은 위치는 파싱하면서 앞으로 가므로, 대기열에 넣기 전에 취소(종료)되면
+        # 그 기록은 보내지 못한 것 - 미리 대기 중으로 잡아 두어 상태가 저장되지 않게 함
+        self.pending[game] += 1
+        loop = asyncio.get_running_loop()
+        logs = await loop.run_in_executor(None, self._parse, game, full, wait_for_tail)
+        self.parsed_stat[game] = stat_key
+        if not full:
+            logs = self._drop_seen(game, logs)
+        if logs:
+            self.send_queue.put_nowait((game, logs, full))
+        else:
+            self.pending[game] -= 1
+        
+        if wait_for_tail and self.deferred_tail[game]:
+            settler = asyncio.create_task(self._settle(game, stat_key))
+            self.settlers.add(settler)
+            settler.add_done_callback(self.settlers.discard)
+    
+    async def _settle(self, game, stat_key):
+        """미뤄둔 마지막 줄: 파일이 1초 동안 그대로면 쓰기가 끝난 것으로 보고 마저 파싱
+        (그 사이 또 바뀌었으면 그 변경 이벤트가 처리)"""
+        await asyncio.sleep(1.0)
+        try:
+            st = os.stat(LOG_PATHS[game])
+        except OSError:
+            return
+        if (st.st_mtime_ns, st.st_size) == stat_key:
+            await self._parse_one(game)
+    
+    def _drop_seen(self, game, logs):
+        """서버가 이미 받은 기록 제외 (정확한 키 비교 - 블룸 필터처럼 새 기록을 잘못 버리지 않음)"""
+        columns = DEDUP_KEYS.get(game)
+        if not columns or not logs:
+            return logs
+        
+        seen = self.seen[game]
+        return [log for log in logs if tuple(log[column] for column in columns) not in seen]
+    
+    def _on_sent(self, game, logs, sent, batches=1, full=False):
+        """전송 결과 반영: 서버가 받은(200) 배치만 보낸 기록으로 표시
+        (실패한 기록은 다음 파싱에서 다시 보낼 수 있도록 남겨둠)"""
+        self.pending[game] -= batches
+        if not sent:
+            self.failed.add(game)
+            return
+        if full:
+            # 파일 전체가 전달됨 - 앞서 실패한 기록도 이번에 함께 들어감
+            self.failed.discard(game)
+        
+        columns = DEDUP_KEYS.get(game)
+        if not columns:
+            return
+        
+        seen = self.seen[game]
+        for log in logs:
+            seen.add(tuple(log[column] for column in columns))
+    
+    async def _send_worker(self):
+        """전송 워커: 대기열에 쌓인 배치를 게임별로 합쳐서 한 번에 전송
+        (감시 루프는 HTTP 응답을 기다리지 않고 다음 이벤트를 처리)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batches = [await self.send_queue.get()]
+            while not self.send_queue.empty() and len(batches) < 32:
+                batches.append(self.send_queue.get_nowait())
+            
+            merged = {}
+            counts = {}
+            fulls = set()
+            for game, logs, full in batches:
+                merged.setdefault(game, []).extend(logs)
+                counts[game] = counts.get(game, 0) + 1
+                if full:
+                    fulls.add(game)
+            
+            for game, logs in merged.items():
+                # 배치 하나가 실패해도 워커는 계속 (죽으면 이후 배치가 대기열에 쌓이기만 함)
+                try:
+                    sent = await loop.run_in_executor(None, send_to_api, game, logs)
+                except Exception as e:
+                    print(f"❌ [{game}] 전송 오류: {e}")
+                    sent = False
+                self._on_sent(game, logs, sent, counts[game], game in fulls)
+    
+    def _parse(self, game, from_start=False, wait_for_tail=False):
+        """게임 로그 파싱 (줄 단위 로그는 새로 추가된 부분만, from_start면 처음부터)"""
+        entry = PARSERS.get(game)
+        if entry is None:
+            return []
+        
+        parse, appended_only = entry
+        if appended_only:
+            return parse(self._read_appended(game, from_start, wait_for_tail))
+        return parse(LOG_PATHS[game])
+    
+    def _read_appended(self, game, from_start=False, wait_for_tail=False):
+        """지난번 이후 파일 끝에 추가된 줄만 읽기
+        
+        점수 파일은 게임이 제자리에서 다시 쓰기도 하므로, 이미 읽은 앞부분의
+        crc32가 달라졌거나 파일이 줄었으면 처음부터 다시 읽는다.
+        from_start: 읽은 위치를 (0, 0)으로 되돌리고 처음부터 (수동 파싱)
+        wait_for_tail: 개행 없는 마지막 줄은 아직 쓰는 중일 수 있으므로 남겨둠
+        """
+        with self.offsets_lock:
+            offset, crc = (0, 0) if from_start else self.offsets[game]
+            # mmap은 게임이 파일을 잘라내면 SIGBUS로 프로세스가 죽으므로 통째로 읽음 (수 KB)
+            try:
+                with open(LOG_PATHS[game], 'rb') as f:
+                    buf = f.read()
+            except OSError:
+                return b''
+            
+            if len(buf) < offset or zlib.crc32(buf[:offset]) != crc:
+                offset, crc = 0, 0
+            
+            if wait_for_tail:
+                # 아직 쓰는 중일 수 있는 마지막 줄(개행 없음)은 다음 번에
+                end = max(buf.rfind(b'\n', offset) + 1, offset)
+            else:
+                end = len(buf)
+            self.deferred_tail[game] = end < len(buf)
+            if end <= offset:
+                return b''
+            chunk = buf[offset:end]
+            
+            self.offsets[game] = (end, zlib.crc32(chunk, crc))
+            return chunk
     
     def stop(self):
         """정지"""
         self.running = False
+        for task in (self.task, self.sender, *self.settlers):
+            if task:
+                task.cancel()
+        
+        # 아직 못 보낸 배치는 종료 전에 마저 전송
+        while not self.send_queue.empty():
+            game, logs, full = self.send_queue.get_nowait()
+            try:
+                sent = send_to_api(game, logs)
+            except Exception as e:
+                print(f"❌ [{game}] 전송 오류: {e}")
+                sent = False
+            self._on_sent(game, logs, sent, full=full)
     
-    def parse_all(self):
-        """모든 로그 수동 파싱"""
+    async def parse_all(self, skip_unchanged=False):
+        """모든 로그 파싱 (게임별 파싱+전송을 동시에 실행)
+        각 게임은 자기 파싱이 끝나는 대로 전송 - 가장 느린 파싱을 기다리지 않음
+        skip_unchanged: 시작 시 - 지난 실행 이후 그대로인 파일은 건너뛰고 저장된 위치부터 읽음
+        기본(메뉴 4 수동 파싱): 처음부터 전부 다시 읽어 전송 - 전송 실패분 복구용"""
         print("\n📊 모든 로그 파싱 중...")
+        full = not skip_unchanged
+        await asyncio.gather(*[self._parse_one(game, skip_unchanged, full) for game in LOG_PATHS])
+    
+    def _load_state(self):
+        """지난 실행에서 저장한 파일 상태와 읽은 위치 복원
+        (위치는 _read_appended가 crc32로 다시 확인하므로 파일이 바뀌었어도 안전)"""
+        try:
+            with open(STATE_FILE, 'rb') as f:
+                state = loads_json(f.read())
+        except (OSError, ValueError):
+            return
+        if not isinstance(state, dict):
+            return  # 형식이 다른 파일은 무시 (처음부터 파싱)
         
-        for game, path in LOG_PATHS.items():
-            if game == "neverball":
-                logs = parse_neverball_log(path)
-            elif game == "supertux":
-                logs = parse_supertux_log(path)
-            elif game == "etr":
-                logs = parse_etr_log(path)
-            else:
-                logs = []
-            
-            if logs:
-                send_to_api(game, logs)
+        for game, entry in state.items():
+            if game not in LOG_PATHS:
+                continue
+            try:
+                stat_key = (int(entry["mtime_ns"]), int(entry["size"]))
+                offset = (int(entry["offset"]), int(entry["crc"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.parsed_stat[game] = stat_key
+            self.offsets[game] = offset
+    
+    def save_state(self):
+        """파일 상태와 읽은 위치 저장 (종료 시)
+        읽은 내용이 전부 서버에 전달된 게임만 저장 - 전송 실패/미전송 배치가 있는
+        게임은 빼서 다음 시작 때 처음부터 다시 파싱해 보냄 (중복은 DB가 거름)"""
+        state = {}
+        with self.offsets_lock:
+            for game, stat_key in self.parsed_stat.items():
+                if stat_key is None or self.pending[game] or game in self.failed:
+                    continue
+                offset, crc = self.offsets[game]
+                state[game] = {
+                    "mtime_ns": stat_key[0],
+                    "size": stat_key[1],
+                    "offset": offset,
+                    "crc": crc
+                }
+        
+        try:
+            os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+            tmp_path = STATE_FILE + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(dumps_json(state))
+            os.replace(tmp_path, STATE_FILE)
+        except OSError as e:
+            print(f"⚠️  감시 상태 저장 실패: {e}")
 
 # =================================================================
 # 🚀 메인
 # =================================================================
 
-def main():
+async def main():
     print("\n")
     print("╔════════════════════════════════════════════════════════╗")
     print("║         🎮 NotPortable 올인원 서버 🎮                   ║")
@@ -572,9 +1173,15 @@ def main():
     print("╚════════════════════════════════════════════════════════╝")
     print()
     
+    # Ctrl+C / SIGTERM은 이벤트 루프에서 받아 종료 이벤트로
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
     # 가상 키보드 시작
     keyboard = VirtualKeyboard()
-    keyboard.start()
+    await keyboard.start()
     
     # 로그 감시 시작
     watcher = LogWatcher()
@@ -582,62 +1189,76 @@ def main():
     
     # 초기 로그 파싱
     print("\n📊 초기 로그 로딩...")
-    watcher.parse_all()
+    await watcher.parse_all(skip_unchanged=True)
     
     print("\n✅ 모든 서비스 시작 완료!")
     print("   ESP32 컨트롤러 연결 대기 중...")
     
+    # 메뉴는 별도 태스크 - 입력 대기 중이어도 종료 이벤트가 오면 바로 정리
+    menu = asyncio.create_task(run_menu(watcher))
+    stopper = asyncio.create_task(stop.wait())
     try:
-        while True:
-            show_menu()
-            
-            try:
-                choice = input("\n선택: ").strip()
-                if not choice:
-                    continue
-                choice = int(choice)
-            except ValueError:
-                print("❌ 숫자를 입력하세요")
-                continue
-            
-            if choice == 0:
-                print("\n👋 종료합니다...")
-                break
-            
-            elif choice in [1, 2, 3]:
-                # SuperTux만 이름 입력 (다른 게임은 게임 내에서 설정)
-                if choice == 2:
-                    username = input("사용자 이름: ").strip()
-                    if not username:
-                        username = "Player"
-                else:
-                    username = None
-                launch_game(choice, username)
-            
-            elif choice == 4:
-                watcher.parse_all()
-            
-            elif choice == 5:
-                print("\n📐 MPU 상태:")
-                print(f"   활성화: {mpu_detector.enabled}")
-                if mpu_detector.baseline_pitch is not None:
-                    print(f"   기준값: Pitch={mpu_detector.baseline_pitch:.1f}°, Roll={mpu_detector.baseline_roll:.1f}°")
-                    print(f"   현재값: Pitch={mpu_detector.current_pitch:.1f}°, Roll={mpu_detector.current_roll:.1f}°")
-                else:
-                    print("   기준값: 아직 캘리브레이션 중...")
-                    print(f"   샘플: {len(mpu_detector.calibration_samples)}/{mpu_detector.calibration_count}")
-            
-            else:
-                print("❌ 잘못된 선택")
-    
-    except KeyboardInterrupt:
-        print("\n\n👋 Ctrl+C로 종료")
+        await asyncio.wait({menu, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        if stop.is_set():
+            print("\n\n👋 Ctrl+C로 종료")
+        else:
+            menu.result()  # 메뉴에서 난 예외는 그대로 전달
     
     finally:
+        for task in (menu, stopper):
+            task.cancel()
         keyboard.stop()
         watcher.stop()
+        watcher.save_state()
         print("✅ 정리 완료")
 
+async def run_menu(watcher):
+    """메뉴 입력 루프 (0 선택 또는 입력 종료 시 반환)"""
+    while True:
+        show_menu()
+        
+        try:
+            choice = (await ainput("\n선택: ")).strip()
+            if not choice:
+                continue
+            choice = int(choice)
+        except ValueError:
+            print("❌ 숫자를 입력하세요")
+            continue
+        except EOFError:
+            return
+        
+        if choice == 0:
+            print("\n👋 종료합니다...")
+            return
+        
+        elif choice in [1, 2, 3]:
+            # SuperTux만 이름 입력 (다른 게임은 게임 내에서 설정)
+            if choice == 2:
+                username = (await ainput("사용자 이름: ")).strip()
+                if not username:
+                    username = "Player"
+            else:
+                username = None
+            # 게임 실행 중에도 UDP 컨트롤러 입력은 이벤트 루프에서 계속 처리
+            await launch_game(choice, username)
+        
+        elif choice == 4:
+            await watcher.parse_all()
+        
+        elif choice == 5:
+            print("\n📐 MPU 상태:")
+            print(f"   활성화: {mpu_detector.enabled}")
+            if mpu_detector.baseline_pitch is not None:
+                print(f"   기준값: Pitch={mpu_detector.baseline_pitch:.1f}°, Roll={mpu_detector.baseline_roll:.1f}°")
+                print(f"   현재값: Pitch={mpu_detector.current_pitch:.1f}°, Roll={mpu_detector.current_roll:.1f}°")
+            else:
+                print("   기준값: 아직 캘리브레이션 중...")
+                print(f"   샘플: {mpu_detector.sample_count}/{mpu_detector.calibration_count}")
+        
+        else:
+            print("❌ 잘못된 선택")
+
 if __name__ == "__main__":
     # root 권한 체크
     if os.geteuid() != 0 and EVDEV_AVAILABLE:
@@ -645,4 +1266,7 @@ if __name__ == "__main__":
         print("   sudo python3 notportable_all_in_one.py")
         print()
     
-    main()
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass  # main()에서 정리 완료
\ No newline at end of file